@@ -1,46 +1,295 @@
-from flask import Flask, request, jsonify, redirect, url_for
+from flask import Flask, Response, request, redirect, url_for
+import hashlib
+import os
+import threading
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 from flasgger import Swagger
 
 app = Flask(__name__)
 Swagger(app)
 
-# Store users in memory or database
-users = []
+# Store users in memory or database, as name -> age in insertion order
+users = {}
+# Running age totals and user counts per first letter of the name,
+# updated on every write so average-age needs no pass over users
+_sum_by_group = {}
+_count_by_group = {}
+# Uploaded CSV files are parsed in blocks of this many bytes
+CSV_BLOCK_SIZE = 1 << 20
+# Rows per chunk when falling back to pandas for files pyarrow rejects
+CSV_CHUNK_ROWS = 50000
+# Reject request bodies (e.g. CSV uploads) larger than this
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+
+# Column types of uploaded CSV files
+_CSV_SCHEMA = pa.schema([('Name', pa.string()), ('Age', pa.string())])
+# Cells read as missing by both parsers: pandas' default set, which
+# pyarrow's default lacks 'None' and '<NA>' from
+_CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+    'n/a', 'nan', 'null',
+]
+
+# Validation errors of uploaded rows, indexed by error code
+_ERR_EMPTY_NAME = 1
+_ERR_AGE_EMPTY = 2
+_ERR_AGE_NOT_NUMBER = 3
+_ERR_AGE_NOT_INTEGER = 4
+_ERR_AGE_RANGE = 5
+_ERR_USER_EXISTS = 6
+_VALIDATION_ERRORS = np.array([
+    '',
+    'Name cannot be empty',
+    'Age cannot be empty',
+    'Age must be a number',
+    'Age must be an integer',
+    'Age must be between 1 and 120',
+    # Filled in with the user's name only when the response is built
+    'User {} already exists',
+], dtype=object)
+
+# Guards `users`, the group totals and the cached body: writers hold it
+# for their check-then-write, readers while iterating shared state.
+# Under a gevent worker threading is monkey-patched, so this becomes a
+# cooperative lock.
+_lock = threading.Lock()
+# Serialized GET /users body and its ETag, rebuilt after any write
+_users_cache = None
+_users_etag = None
+
+def _reset_state():
+    """
+    Remove all stored users (used by the tests).
+    """
+    users.clear()
+    _sum_by_group.clear()
+    _count_by_group.clear()
+    _invalidate()
+
+def _json(obj, status=200):
+    """
+    Build a JSON response, serialized with orjson.
+    """
+    return Response(
+        orjson.dumps(obj),
+        status=status,
+        mimetype='application/json',
+    )
+
+def _invalidate():
+    """
+    Drop cached responses after the stored users change.
+    """
+    global _users_cache, _users_etag
+    _users_cache = None
+    _users_etag = None
+
+def _add_to_groups(pairs):
+    """
+    Add the ages of newly stored (name, age) pairs to the group totals.
+    """
+    sum_get = _sum_by_group.get
+    count_get = _count_by_group.get
+    for name, age in pairs:
+        group = name[:1].upper()
+        _sum_by_group[group] = sum_get(group, 0) + age
+        _count_by_group[group] = count_get(group, 0) + 1
+
+def _remove_from_groups(name, age):
+    """
+    Remove a deleted user's age from the group totals.
+    """
+    group = name[:1].upper()
+    if _count_by_group[group] == 1:
+        del _sum_by_group[group]
+        del _count_by_group[group]
+    else:
+        _sum_by_group[group] -= age
+        _count_by_group[group] -= 1
+
+def _dump_users(pairs):
+    """
+    Serialize (name, age) pairs as a JSON array of user records, writing
+    one user at a time into a bytearray instead of building a dict per user.
+    Returns: bytes of [{"Name": str, "Age": int}, ...]
+    """
+    dumps = orjson.dumps
+    buf = bytearray(b'[')
+    for name, age in pairs:
+        buf += b'{"Name":%b,"Age":%d},' % (dumps(name), age)
+    if len(buf) > 1:
+        # Turn the trailing comma into the closing bracket
+        buf[-1:] = b']'
+    else:
+        buf += b']'
+    return bytes(buf)
 
 def user_exists(name):
     """
     Check if a user with the given name already exists.
     Returns: bool
     """
-    return any(user['Name'] == name for user in users)
+    return name in users
+
+def _read_csv(stream):
+    """
+    Parse and validate an uploaded CSV block by block.
+    pyarrow rejects the whole file when a row has too few fields, while
+    pandas fills the missing fields with NaN; files pyarrow cannot parse
+    are read again with pandas, which still fails on rows with extra fields.
+    Returns: list of (names, ages, errors) per block, see _validate_batch
+    Raises: KeyError if the Name or Age column is missing
+    """
+    try:
+        reader = pacsv.open_csv(
+            stream,
+            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=pacsv.ConvertOptions(
+                # Only convert the columns we use; extra columns are skipped
+                include_columns=['Name', 'Age'],
+                # Parse Age as text too: its type is otherwise inferred from
+                # the first block only, and a later bad value would fail the
+                # whole file instead of its row
+                column_types=_CSV_SCHEMA,
+                null_values=_CSV_NULL_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+        # Nothing is stored until the whole file has parsed
+        return [_validate_batch(batch) for batch in reader]
+    except pa.ArrowInvalid:
+        stream.seek(0)
+
+    # pandas raises on a row with extra fields only when an earlier row set
+    # the field count; a wider first row would silently drop its extra
+    # fields, so check it against the header before reading the file
+    pd.read_csv(stream, header=None, nrows=2, dtype=str)
+    stream.seek(0)
+    chunks = pd.read_csv(
+        stream,
+        dtype=str,
+        # Never take the first column as the index
+        index_col=False,
+        keep_default_na=False,
+        na_values=_CSV_NULL_VALUES,
+        chunksize=CSV_CHUNK_ROWS,
+    )
+    return [
+        _validate_batch(pa.RecordBatch.from_pandas(
+            chunk[['Name', 'Age']], schema=_CSV_SCHEMA, preserve_index=False
+        ))
+        for chunk in chunks
+    ]
+
+def _validate_batch(batch):
+    """
+    Validate one block of an uploaded CSV, column by column.
+    Returns: (names: ndarray, ages: ndarray, errors: ndarray), where
+    errors is '' for rows that passed validation
+    """
+    names = pc.utf8_trim_whitespace(batch.column('Name')).to_pandas()
+    raw_ages = batch.column('Age').to_pandas()
+    ages = pd.to_numeric(raw_ages, errors='coerce').to_numpy(dtype='float64')
+
+    codes = _age_error_codes(raw_ages.isna().to_numpy(), ages)
+    codes[(names.isna() | (names == '')).to_numpy()] = _ERR_EMPTY_NAME
+    return names.to_numpy(), ages, _VALIDATION_ERRORS[codes]
+
+def _age_error_codes(missing, ages):
+    """
+    Classify an array of ages with NumPy ufuncs, one pass per check.
+    Checks are applied from lowest to highest priority, so each row keeps
+    the error validate_user_data would report first.
+    Returns: int8 ndarray of indexes into _VALIDATION_ERRORS, 0 if valid
+    """
+    codes = np.zeros(len(ages), dtype=np.int8)
+    with np.errstate(invalid='ignore'):
+        codes[(ages <= 0) | (ages > 120)] = _ERR_AGE_RANGE
+        # NaN and inf leave a NaN remainder, which is also != 0
+        codes[np.fmod(ages, 1) != 0] = _ERR_AGE_NOT_INTEGER
+    codes[np.isnan(ages)] = _ERR_AGE_NOT_NUMBER
+    codes[missing] = _ERR_AGE_EMPTY
+    return codes
+
+def _ingest(names, ages, errors, existing):
+    """
+    Split the validated rows of an uploaded CSV into users to add and
+    rejected rows in one call. Rows whose name is in `existing` or was
+    accepted earlier in the file are rejected as duplicates, with the
+    unformatted _ERR_USER_EXISTS message written into `errors`.
+    Returns: (added: list of (name, age),
+              invalid: list of (row, error, name))
+    """
+    valid = errors == ''
+    # Bind hot lookups to locals once, outside the per-row loop
+    accepted = set()
+    accepted_add = accepted.add
+    duplicates = []
+    duplicates_append = duplicates.append
+    valid_idx = np.flatnonzero(valid)
+    for idx, name in zip(valid_idx.tolist(), names[valid_idx].tolist()):
+        if name in existing or name in accepted:
+            duplicates_append(idx)
+        else:
+            accepted_add(name)
+    valid[duplicates] = False
+    errors[duplicates] = _VALIDATION_ERRORS[_ERR_USER_EXISTS]
+
+    added = list(zip(names[valid].tolist(), ages[valid].astype('int64').tolist()))
+    # Row numbers are 1-based and count the header line
+    invalid_idx = np.flatnonzero(~valid)
+    invalid = list(zip(
+        (invalid_idx + 2).tolist(),
+        errors[invalid_idx].tolist(),
+        names[invalid_idx].tolist(),
+    ))
+    return added, invalid
 
 def validate_user_data(name, age):
     """
     Validate user name and age.
-    Returns: (is_valid: bool, error_message: str)
+    Returns: (is_valid: bool, error_message: str, age: int or None)
     """
     # Name validation
-    if not isinstance(name, str) or pd.isna(name) or name.strip() == '':
-        return False, 'Name cannot be empty'
+    if not isinstance(name, str) or not name.strip():
+        return False, 'Name cannot be empty', None
 
-    # Age validation
-    if pd.isna(age):
-        return False, 'Age cannot be empty'
-    
+    # Responses are encoded as UTF-8, so e.g. lone surrogates cannot be stored
     try:
-        age_float = float(age)
-    except (ValueError, TypeError):
-        return False, 'Age must be a number'
+        name.encode('utf-8')
+    except UnicodeEncodeError:
+        return False, 'Name must be valid UTF-8 text', None
+
+    # Age validation, NaN is the only value not equal to itself
+    if age is None or (isinstance(age, float) and age != age):
+        return False, 'Age cannot be empty', None
+
+    # bool is a subclass of int, but True is not an age
+    if isinstance(age, bool):
+        return False, 'Age must be a number', None
+
+    if isinstance(age, int):
+        age_int = age
+    else:
+        try:
+            age_float = float(age)
+        except (ValueError, TypeError):
+            return False, 'Age must be a number', None
 
-    if not age_float.is_integer():
-        return False, 'Age must be an integer'
+        if not age_float.is_integer():
+            return False, 'Age must be an integer', None
+        age_int = int(age_float)
 
-    age = int(age_float)
-    if age <= 0 or age > 120:
-        return False, 'Age must be between 1 and 120'
+    if age_int <= 0 or age_int > 120:
+        return False, 'Age must be between 1 and 120', None
 
-    return True, ''
+    return True, '', age_int
 
 @app.route('/users', methods=['POST'])
 def create_user():
@@ -76,25 +325,31 @@ def create_user():
     data = request.get_json()
   
     if not data:
-        return jsonify({'error': 'Name and age are required'}), 400
+        return _json({'error': 'Name and age are required'}, 400)
     
     name = data.get('Name')
     age = data.get('Age')
 
-    is_valid, error = validate_user_data(name, age)
+    # Retries of an existing user are the most common rejection, so answer
+    # them with one lookup before validating
+    if isinstance(name, str) and user_exists(name.strip()):
+        return _json({'error': 'User already exists'}, 400)
+
+    is_valid, error, age = validate_user_data(name, age)
     if not is_valid:
-        return jsonify({'error': error}), 400
+        return _json({'error': error}, 400)
     
     name = str(name).strip()
-    age = int(age)
 
-    # Check if user already exists
-    if user_exists(name):
-        return jsonify({'error': 'User already exists'}), 400
-    
-    user = {'Name': name, 'Age': age}
-    users.append(user)
-    return jsonify(user), 201
+    with _lock:
+        # Check if user already exists
+        if user_exists(name):
+            return _json({'error': 'User already exists'}, 400)
+
+        users[name] = age
+        _add_to_groups([(name, age)])
+        _invalidate()
+    return _json({'Name': name, 'Age': age}, 201)
 
 @app.route('/users/<name>', methods=['DELETE'])
 def delete_user(name):
@@ -116,15 +371,18 @@ def delete_user(name):
         description: User not found
     """
     if not name or name.strip() == '':
-        return jsonify({'error': 'Name cannot be empty'}), 400
+        return _json({'error': 'Name cannot be empty'}, 400)
     
     name = name.strip()
     
-    for user in users:
-        if user['Name'] == name:
-            users.remove(user)
-            return jsonify({'message': f'User {name} deleted successfully'}), 200
-    return jsonify({'error': 'User not found'}), 404
+    with _lock:
+        age = users.pop(name, None)
+        if age is None:
+            return _json({'error': 'User not found'}, 404)
+
+        _remove_from_groups(name, age)
+        _invalidate()
+    return _json({'message': f'User {name} deleted successfully'}, 200)
 
 @app.route('/users', methods=['GET'])
 def get_users():
@@ -152,8 +410,21 @@ def get_users():
                         type: integer
                 count:
                   type: integer
+      304:
+        description: List of users unchanged since the ETag in If-None-Match
     """
-    return jsonify({'data': users, 'count': len(users)}), 200
+    global _users_cache, _users_etag
+    with _lock:
+        # Rebuild under the lock so a concurrent write can neither change
+        # users mid-iteration nor be hidden by a stale cache entry
+        if _users_cache is None:
+            _users_cache = b'{"data":%b,"count":%d}' % (_dump_users(users.items()), len(users))
+            _users_etag = hashlib.blake2b(_users_cache, digest_size=8).hexdigest()
+        body, etag = _users_cache, _users_etag
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 @app.route('/users/upload', methods=['POST'])
 def upload_users():
@@ -176,66 +447,54 @@ def upload_users():
         description: Users added successfully
       400:
         description: Invalid file or CSV format
+      413:
+        description: File is larger than MAX_CONTENT_LENGTH
     """
     if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+        return _json({'error': 'No file provided'}, 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return _json({'error': 'No file selected'}, 400)
         
     if not file.filename.endswith('.csv'):
-        return jsonify({'error': 'File must be a CSV'}), 400
+        return _json({'error': 'File must be a CSV'}, 400)
     
     try:
-        df = pd.read_csv(file)
+        batches = _read_csv(file.stream)
+    except KeyError:
+        # Raised by pyarrow when an included column is not in the header
+        return _json({'error': 'CSV must contain "Name" and "Age" columns'}, 400)
     except Exception as e:
-        return jsonify({'error': f'Error processing CSV file: {str(e)}'}), 400
-    
-    # Validate required columns
-    if not all(col in df.columns for col in ['Name', 'Age']):
-        return jsonify({'error': 'CSV must contain "Name" and "Age" columns'}), 400
-    
-    # Convert DataFrame to list of dictionaries
-    new_users = df.to_dict('records')
-    
-    # Add new users
-    added_users = []
-    invalid_users = []
-    
-    for idx, user in enumerate(new_users):
-        # Validate data types and values
-        name = user.get('Name')
-        age = user.get('Age')
-
-        is_valid, error = validate_user_data(name, age)
-        if not is_valid:
-            invalid_users.append({'row': idx + 2, 'error': error})
-            continue
-        
-        name = str(name).strip()
-        age = int(age)
+        return _json({'error': f'Error processing CSV file: {str(e)}'}, 400)
+
+    if batches:
+        names, ages, errors = (np.concatenate(column) for column in zip(*batches))
+    else:
+        names = errors = np.empty(0, dtype=object)
+        ages = np.empty(0, dtype='float64')
+
+    with _lock:
+        added_users, invalid_rows = _ingest(names, ages, errors, users)
+        users.update(added_users)
+        _add_to_groups(added_users)
+        if added_users:
+            _invalidate()
 
-        # Check if user already exists
-        if user_exists(name):
-            invalid_users.append({'row': idx + 2, 'error': f'User {name} already exists'})
-            continue
-        
-        # Add valid user
-        valid_user = {'Name': name, 'Age': age}
-        users.append(valid_user)
-        added_users.append(valid_user)
-    
     response = {
         'message': f'Successfully added {len(added_users)} users',
-        'added_users': added_users,
+        'added_users': orjson.Fragment(_dump_users(added_users)),
     }
     
-    if invalid_users:
-        response['invalid_users'] = invalid_users
-        response['warning'] = f'{len(invalid_users)} rows skipped due to validation errors or duplicates'
+    if invalid_rows:
+        exists_error = _VALIDATION_ERRORS[_ERR_USER_EXISTS]
+        response['invalid_users'] = [
+            {'row': row, 'error': error.format(name) if error == exists_error else error}
+            for row, error, name in invalid_rows
+        ]
+        response['warning'] = f'{len(invalid_rows)} rows skipped due to validation errors or duplicates'
 
-    return jsonify(response), 201
+    return _json(response, 201)
 
 @app.route('/users/average-age', methods=['GET'])
 def get_average_age_by_group():
@@ -259,20 +518,17 @@ def get_average_age_by_group():
       404:
         description: No users found
     """
-    if not users:
-        return jsonify({'error': 'No users found'}), 404
-    
-    df = pd.DataFrame(users)
-    
-    # Add group column based on first character of usernames
-    df['Group'] = df['Name'].str[0].str.upper()
-    
-    # Calculate average age for each group
-    group_averages = df.groupby('Group')['Age'].mean().round(2).to_dict()
-    
-    return jsonify({
-        'average_age': group_averages
-    }), 200
+    with _lock:
+        if not users:
+            return _json({'error': 'No users found'}, 404)
+
+        # Calculate average age for each group from the running totals
+        group_averages = {
+            group: round(_sum_by_group[group] / _count_by_group[group], 2)
+            for group in _sum_by_group
+        }
+
+    return _json({'average_age': group_averages}, 200)
 
 # Redirect root to Swagger UI
 @app.route("/")
@@ -0,0 +1,18 @@
+import os
+
+# Gunicorn settings, used by `gunicorn app:app`
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Users are kept in process memory, so every worker has its own copy.
+# Keep a single worker unless the store is moved out of process
+# (e.g. Redis); threads still let requests run concurrently.
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# 'gevent' serves many slow uploads per worker by yielding on socket reads
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master before forking workers. The gevent
+# worker must monkey-patch before the app is imported, so it loads the
+# app in each worker instead.
+preload_app = worker_class != 'gevent'
@@ -1,7 +1,8 @@
 import unittest
 import json
-from app import app, users
+from app import app, _reset_state
 import io
+from unittest.mock import patch
 import pandas as pd
 
 class TestUserAPI(unittest.TestCase):
@@ -10,7 +11,7 @@ class TestUserAPI(unittest.TestCase):
         self.app = app
         self.client = self.app.test_client()
         # Clear users before each test
-        users.clear()
+        _reset_state()
 
     def test_create_user_success(self):
         """Test creating a new user successfully."""
@@ -38,6 +39,35 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('Age must be between 1 and 120', response.get_data(as_text=True))
 
+    def test_create_user_boolean_age(self):
+        """Test creating a user with a boolean age."""
+        response = self.client.post('/users',
+                                  data=json.dumps({'Name': 'John', 'Age': True}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Age must be a number', response.get_data(as_text=True))
+
+    def test_create_user_string_age(self):
+        """Test creating a user with a whole-number age given as text."""
+        response = self.client.post('/users',
+                                  data=json.dumps({'Name': 'John', 'Age': '30.0'}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['Age'], 30)
+
+    def test_create_user_invalid_unicode_name(self):
+        """Test creating a user whose name cannot be encoded as UTF-8."""
+        response = self.client.post('/users',
+                                  data='{"Name": "\\ud800x", "Age": 30}',
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Name must be valid UTF-8 text', response.get_data(as_text=True))
+
+        response = self.client.get('/users')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['count'], 0)
+
     def test_create_user_duplicate(self):
         """Test creating a duplicate user."""
         # Create first user
@@ -51,6 +81,17 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('User already exists', response.get_data(as_text=True))
 
+    def test_create_user_duplicate_checked_first(self):
+        """Test that a duplicate name is reported before invalid fields."""
+        self.client.post('/users',
+                        data=json.dumps({'Name': 'John', 'Age': 30}),
+                        content_type='application/json')
+        response = self.client.post('/users',
+                                  data=json.dumps({'Name': ' John ', 'Age': 999}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('User already exists', response.get_data(as_text=True))
+
     def test_get_users_empty(self):
         """Test getting users when none exist."""
         response = self.client.get('/users')
@@ -70,6 +111,23 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(len(data['data']), 1)
         self.assertEqual(data['count'], 1)
 
+    def test_get_users_not_modified(self):
+        """Test conditional GET with the ETag of an unchanged user list."""
+        self.client.post('/users',
+                        data=json.dumps({'Name': 'John', 'Age': 30}),
+                        content_type='application/json')
+        etag = self.client.get('/users').headers['ETag']
+        response = self.client.get('/users', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A write must change the ETag
+        self.client.post('/users',
+                        data=json.dumps({'Name': 'Jane', 'Age': 25}),
+                        content_type='application/json')
+        response = self.client.get('/users', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['count'], 2)
+
     def test_delete_user_success(self):
         """Test deleting an existing user."""
         # Create a user first
@@ -86,6 +144,19 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn('User not found', response.get_data(as_text=True))
 
+    def test_delete_user_then_recreate(self):
+        """Test that a deleted user's name can be reused."""
+        self.client.post('/users',
+                        data=json.dumps({'Name': 'John', 'Age': 30}),
+                        content_type='application/json')
+        self.client.delete('/users/John')
+        response = self.client.post('/users',
+                                  data=json.dumps({'Name': 'John', 'Age': 40}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(self.client.get('/users').data)
+        self.assertEqual(data['data'], [{'Name': 'John', 'Age': 40}])
+
     def test_upload_users_success(self):
         """Test uploading users from CSV file."""
         # Create a test CSV file in memory
@@ -99,6 +170,95 @@ class TestUserAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(len(data['added_users']), 2)
 
+    def test_upload_users_invalid_rows(self):
+        """Test that invalid and duplicate CSV rows are reported and skipped."""
+        csv_data = "Name,Age\nJohn,30\n,20\nJane,abc\nBob,30.5\nAmy,0\nJohn,22"
+        csv_file = io.BytesIO(csv_data.encode())
+
+        response = self.client.post('/users/upload',
+                                  data={'file': (csv_file, 'test.csv')},
+                                  content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['added_users'], [{'Name': 'John', 'Age': 30}])
+        self.assertEqual(data['invalid_users'], [
+            {'row': 3, 'error': 'Name cannot be empty'},
+            {'row': 4, 'error': 'Age must be a number'},
+            {'row': 5, 'error': 'Age must be an integer'},
+            {'row': 6, 'error': 'Age must be between 1 and 120'},
+            {'row': 7, 'error': 'User John already exists'},
+        ])
+
+    def test_upload_users_short_rows(self):
+        """Test that rows with a missing Age field are reported and skipped."""
+        csv_data = "Name,Age\nJohn,30\nBob\nAmy,20"
+        csv_file = io.BytesIO(csv_data.encode())
+
+        response = self.client.post('/users/upload',
+                                  data={'file': (csv_file, 'test.csv')},
+                                  content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['added_users'], [{'Name': 'John', 'Age': 30},
+                                               {'Name': 'Amy', 'Age': 20}])
+        self.assertEqual(data['invalid_users'], [
+            {'row': 3, 'error': 'Age cannot be empty'},
+        ])
+
+    def test_upload_users_long_rows(self):
+        """Test that rows with more fields than the header fail the upload."""
+        csv_data = "Name,Age\nJohn,30,5\nAmy,20,7"
+        csv_file = io.BytesIO(csv_data.encode())
+
+        response = self.client.post('/users/upload',
+                                  data={'file': (csv_file, 'test.csv')},
+                                  content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(self.client.get('/users').data)
+        self.assertEqual(data['count'], 0)
+
+    def test_upload_users_null_values(self):
+        """Test that missing-value markers are read the same with or without short rows."""
+        for csv_data in ["Name,Age\nNone,30", "Name,Age\nNone,30\nBob"]:
+            csv_file = io.BytesIO(csv_data.encode())
+            response = self.client.post('/users/upload',
+                                      data={'file': (csv_file, 'test.csv')},
+                                      content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 201)
+            data = json.loads(response.data)
+            self.assertEqual(data['added_users'], [])
+            self.assertEqual(data['invalid_users'][0], {'row': 2, 'error': 'Name cannot be empty'})
+
+    def test_upload_users_multiple_blocks(self):
+        """Test uploading a CSV that is parsed in several blocks."""
+        rows = ''.join(f'\nUser{i},{i % 100 + 1}' for i in range(200))
+        csv_data = 'Name,Age' + rows + '\nUser0,30\nBad,abc'
+        csv_file = io.BytesIO(csv_data.encode())
+
+        with patch('app.CSV_BLOCK_SIZE', 256):
+            response = self.client.post('/users/upload',
+                                      data={'file': (csv_file, 'test.csv')},
+                                      content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(len(data['added_users']), 200)
+        self.assertEqual(data['invalid_users'], [
+            {'row': 202, 'error': 'User User0 already exists'},
+            {'row': 203, 'error': 'Age must be a number'},
+        ])
+
+    def test_upload_users_extra_columns(self):
+        """Test that columns other than Name and Age are ignored."""
+        csv_data = "Id,Name,Email,Age\n1,John,john@example.com,30"
+        csv_file = io.BytesIO(csv_data.encode())
+
+        response = self.client.post('/users/upload',
+                                  data={'file': (csv_file, 'test.csv')},
+                                  content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['added_users'], [{'Name': 'John', 'Age': 30}])
+
     def test_upload_users_invalid_format(self):
         """Test uploading users with invalid CSV format."""
         # Create an invalid CSV file in memory
@@ -111,6 +271,17 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('CSV must contain', response.get_data(as_text=True))
 
+    def test_upload_users_too_large(self):
+        """Test that uploads over MAX_CONTENT_LENGTH are rejected."""
+        csv_data = "Name,Age\nJohn,30\nJane,25"
+        csv_file = io.BytesIO(csv_data.encode())
+
+        with patch.dict(self.app.config, {'MAX_CONTENT_LENGTH': 16}):
+            response = self.client.post('/users/upload',
+                                      data={'file': (csv_file, 'test.csv')},
+                                      content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 413)
+
     def test_get_average_age_by_group(self):
         """Test getting average age by name group."""
         # Add test users
@@ -130,6 +301,21 @@ class TestUserAPI(unittest.TestCase):
         self.assertEqual(data['average_age']['A'], 25.0)  # (20 + 30) / 2
         self.assertEqual(data['average_age']['B'], 25.0)
 
+    def test_get_average_age_after_delete(self):
+        """Test that deleted users no longer count towards the averages."""
+        for user in [{'Name': 'Alice', 'Age': 20}, {'Name': 'Amy', 'Age': 30},
+                     {'Name': 'Bob', 'Age': 25}]:
+            self.client.post('/users',
+                           data=json.dumps(user),
+                           content_type='application/json')
+        self.client.delete('/users/Amy')
+        self.client.delete('/users/Bob')
+
+        response = self.client.get('/users/average-age')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['average_age'], {'A': 20.0})
+
     def test_get_average_age_empty(self):
         """Test getting average age when no users exist."""
         response = self.client.get('/users/average-age')